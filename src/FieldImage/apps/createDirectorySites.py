@@ -1,8 +1,8 @@
 # Copyright (c) 2025 Eli Knodel
 # Licensed under the BSD 3-Clause License. See LICENSE file for details.
 
-import yaml
 import os
+import re
 import sys
 
 from pathlib import Path
@@ -12,9 +12,92 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-from utils.generalHelpers import get_list_input, get_date_input, print_directory_structure
+from utils.generalHelpers import get_list_input, get_date_input, print_directory_structure, batch_prompt
 from utils.constants import GREEN, RESET
 
+# characters that are always safe in a bare scalar; anything else gets quoted
+SAFE_SCALAR_RE = re.compile(r"[A-Za-z0-9 _.\-]+\Z")
+# safe-charset values that yaml 1.1 would still not read back as plain strings
+# (booleans, null, decimal/hex/octal numbers with optional underscores, .inf/.nan)
+AMBIGUOUS_SCALAR_RE = re.compile(
+    r"^(?:true|false|yes|no|on|off|null|~"
+    r"|[-+]?(?:[\d.][\d.eE+_-]*|\.inf)|\.nan"
+    r"|0x[0-9a-f_]+|0o[0-7_]+)$",
+    re.IGNORECASE,
+)
+
+
+def _yaml_scalar(value):
+    """Formats a value as a yaml scalar, quoting it whenever a bare scalar could be misread."""
+
+    if (not value
+        or value != value.strip()
+        or value[0] in "-? "
+        or not SAFE_SCALAR_RE.fullmatch(value)
+        or AMBIGUOUS_SCALAR_RE.match(value)):
+        escaped = value.replace("'", "''")
+        return f"'{escaped}'"
+
+    return value
+
+
+def _serialize_site_yaml(site_dict):
+    """Serializes a flat site dictionary as yaml, preserving insertion order.
+       The site dictionaries only map strings to strings, so this skips the full yaml machinery.
+       Keys are user-entered category names, so they get the same quoting as values.
+       The on-disk format stays yaml (not json or similar): users are told to hand-edit these
+       files, and ipro-locator discovers them by globbing *.yaml."""
+
+    return "".join(f"{_yaml_scalar(key)}: {_yaml_scalar(value)}\n" for key, value in site_dict.items())
+
+
+def _write_site_yaml(path, payload):
+    """Writes a pre-serialized site yaml in one call, skipping the write entirely
+       when the file already holds identical content (the re-run case)."""
+
+    encoded = payload.encode()
+
+    try:
+        # size first as a cheap mismatch check before reading the file back
+        if path.stat().st_size == len(encoded) and path.read_bytes() == encoded:
+            return
+    except OSError:
+        pass
+
+    path.write_bytes(encoded)
+
+
+def _existing_directories(root):
+    """Collects the directories already under root in one recursive scandir pass,
+       so re-runs against a populated tree can skip mkdir calls that would return EEXIST."""
+
+    existing = set()
+    stack = [os.fspath(root)]
+
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    existing.add(entry.path)
+                    stack.append(entry.path)
+
+    return existing
+
+
+def _prompt_value(category, is_required):
+    """Prompts for one category value, re-asking while a required category is left empty."""
+
+    while True:
+        info_input = input(f"{category}: ").strip()
+
+        if info_input == "exit":
+            exit()
+        if info_input or not is_required:
+            return info_input
+
+        print(f"{category.capitalize()} is required. Please enter a value. Enter 'exit' to quit.\n")
+
+
 def get_sites(date_list):
     """Asks for the sites where data will be collected for each date, returns a dictionary with a list of sites for each date."""
 
@@ -34,18 +117,14 @@ def get_site_information(date_site_dict, date_list, empty=False):
     """Asks for additional information regarding each site and stores it in a list of dictionaries."""
 
     sites = [site for site_list in date_site_dict.values() for site in site_list]
-    sites_set = set()
-    unique_sites = []
-    for site in sites:
-        if site not in sites_set:
-            sites_set.add(site)
-            unique_sites.append(site)
+    # order-preserving dedupe
+    unique_sites = list(dict.fromkeys(sites))
 
-    outer_site_dict = {site: None for site in sites_set}
+    outer_site_dict = {}
 
     REPEAT_SITE = False
 
-    if len(sites) != len(sites_set):
+    if len(sites) != len(unique_sites):
         print("There appears to be at least one site that spans across multiple days.\n"
         "We assume that site information is consistent over time.\n"
         "Please give the site multiple unique names if you would like to have differing information for the "
@@ -66,6 +145,12 @@ def get_site_information(date_site_dict, date_list, empty=False):
 
     categories.insert(0, "city")
 
+    # whether a category is required is a property of the category,
+    # so it is decided once here rather than on every prompt
+    required = {"city"}
+    prompts = [(category, category in required) for category in categories]
+    optional_categories = [category for category, is_required in prompts if not is_required]
+
     if not REPEAT_SITE:
         same_info_same_date = input("Will site attributes be the same for all sites visited on the same date?\n"
         "If you enter 'yes', you will enter site information by date. If you enter 'no', you will enter site information by site (yes/no): ").strip().lower()
@@ -77,30 +162,21 @@ def get_site_information(date_site_dict, date_list, empty=False):
 
             site_dict = {}
 
-            for category in categories:
-                while True:
-                    info_input = input(f"{category}: ").strip()
-                    
-                    if info_input == "exit":
-                        exit()
-                    if info_input:
-                        break
-                    if category == "city":
-                        print("City is required. Please enter a value. Enter 'exit' to quit.\n")
-                    else:
-                        break
-
-                site_dict[category] = info_input
-            
+            # required categories are validated one line at a time; the optional
+            # ones are batched into a single prompt block
+            for category, is_required in prompts:
+                if is_required:
+                    site_dict[category] = _prompt_value(category, is_required)
+
+            if optional_categories:
+                site_dict.update(zip(optional_categories, batch_prompt(optional_categories)))
+
             print()
 
             date_sites = date_site_dict[date]
 
             for site in date_sites:
-                unique_site_dict = site_dict.copy()
-                unique_site_dict["site-name"] = site
-
-                outer_site_dict[site] = unique_site_dict
+                outer_site_dict[site] = {**site_dict, "site-name": site}
     else:
         for site in unique_sites:
             print(f"{GREEN}{site}{RESET}\n")
@@ -109,20 +185,12 @@ def get_site_information(date_site_dict, date_list, empty=False):
 
             site_dict["site-name"] = site
 
-            for category in categories:
-                while True:
-                    info_input = input(f"{category}: ").strip()
-                    
-                    if info_input == "exit":
-                        exit()
-                    if info_input:
-                        break
-                    if category == "city":
-                        print("City is required. Please enter a value. Enter 'exit' to quit.\n")
-                    else:
-                        break
-
-                site_dict[category] = info_input
+            for category, is_required in prompts:
+                if is_required:
+                    site_dict[category] = _prompt_value(category, is_required)
+
+            if optional_categories:
+                site_dict.update(zip(optional_categories, batch_prompt(optional_categories)))
 
             print()
 
@@ -162,7 +230,7 @@ def main():
             site_information_dict = get_site_information(date_site_dict, date_list, empty=True)
 
         # get list of photographers
-        photographers = get_list_input(f"Please enter a comma-separated list of the {GREEN}names{RESET} of people that will be taking photographs:")
+        photographers = tuple(get_list_input(f"Please enter a comma-separated list of the {GREEN}names{RESET} of people that will be taking photographs:"))
         print()
 
         # naming the outermost directory
@@ -185,27 +253,55 @@ def main():
         overarch_path = Path(directory)
         overarch_path.mkdir(parents=True, exist_ok=True)
 
-        # loops through dates, sites, photographers, creates site.yaml files
+        existing = _existing_directories(directory)
+
+        # only the leaf (photographer) directories are created explicitly;
+        # os.makedirs creates the site level along the way
+        # the joined path prefixes are cached per date and per site
+        leaves = []
+
         for date, site_list in date_site_dict.items():
-            date_path = overarch_path / date
-            date_path.mkdir(parents=True, exist_ok=True)
+            date_str = os.path.join(directory, date)
 
-            for site in site_list:
-                site_path = date_path / site
-                site_path.mkdir(parents=True, exist_ok=True)
+            # the distinct date directories are created once up front, rather than
+            # rediscovered by every leaf's makedirs walking its parents
+            if date_str not in existing:
+                os.makedirs(date_str, exist_ok=True)
 
-                site_dict = site_information_dict.get(site)
-                if site_dict:
-                    with open(overarch_path / f"{site}.yaml", "w") as file:  
-                        yaml.dump(site_dict, file) 
+            for site in site_list:
+                site_str = os.path.join(date_str, site)
 
                 for photographer in photographers:
-                    photographer_path = site_path / photographer
-                    photographer_path.mkdir(parents=True, exist_ok=True)
+                    leaf = os.path.join(site_str, photographer)
+                    if leaf not in existing:
+                        leaves.append(leaf)
+
+        # imported here so the interactive prompts above don't pay for it,
+        # especially when the user aborts before anything is created
+        from concurrent.futures import ThreadPoolExecutor
+
+        # the mkdir and write calls are independent, so a thread pool overlaps
+        # the filesystem latency across many outstanding requests
+        with ThreadPoolExecutor(max_workers=min(32, max(1, len(leaves)))) as executor:
+            list(executor.map(lambda leaf: os.makedirs(leaf, exist_ok=True), leaves))
+
+            # writes each unique site.yaml exactly once, even if the site spans multiple dates
+            # serialization is CPU work, so it happens up front; only the writes overlap
+            payloads = [(overarch_path / f"{site}.yaml", _serialize_site_yaml(site_dict))
+                        for site, site_dict in site_information_dict.items() if site_dict]
+
+            list(executor.map(lambda item: _write_site_yaml(item[0], item[1]), payloads))
+
+        # the structure we just built, so the printer doesn't have to re-walk the filesystem
+        created_tree = {f"{site}.yaml": None for site, site_dict in site_information_dict.items() if site_dict}
+        created_tree.update({
+            date: {site: list(photographers) for site in site_list}
+            for date, site_list in date_site_dict.items()
+        })
 
         # prints structure
         print("Below is the created (or updated) directory structure:\n")
-        print_directory_structure(directory)
+        print_directory_structure(directory, tree=created_tree)
         print()
         print("Please upload images by photographer in the corresponding photographer folders.\n"
         "Make sure that your photo-taking devices are location-enabled.\n"
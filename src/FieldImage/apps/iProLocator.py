@@ -4,36 +4,45 @@
 # If I decide to and can delete images based on PII, give them these original filenames too
 
 import argparse
+import hashlib
+import heapq
+import threading
 import pandas as pd
 import yaml
 import exifread
 import numpy as np
-import subprocess
 import re
 import torch
 import torchvision.models as models
 import torchvision.transforms as transforms
 import os
-import matplotlib.pyplot as plt
+import matplotlib
 import math
 import sys
 import folium
 
+from folium.plugins import MarkerCluster
+from matplotlib.figure import Figure
+
+# headless backend; the histograms only ever go to files
+matplotlib.use("Agg")
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 from urllib.parse import quote
 from torchvision.models import ResNet50_Weights
-from sklearn.metrics.pairwise import cosine_similarity
 from collections import defaultdict
-from PIL import Image as PILImage
+from itertools import combinations
+from openpyxl import Workbook
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-from utils.constants import INPUT_IMAGE_EXTENSIONS, OUTPUT_IMAGE_EXTENSIONS
-from utils.imageHelpers import convert_and_preserve_image_metadata, coord_to_decimal, frac_to_decimal, get_feature_vector, calc_max_pic_size, reduce_image
+from utils.constants import INPUT_IMAGE_SUFFIXES, OUTPUT_IMAGE_SUFFIXES
+from utils.imageHelpers import convert_and_preserve_image_metadata, coord_to_decimal, frac_to_decimal, get_feature_vectors, calc_max_pic_size, reduce_image, is_jpeg
 from utils.generalHelpers import is_valid_date_format
 
 
@@ -49,6 +58,48 @@ def valid_similarity_threshold(value):
     return value
 
 
+def relative_link_path(folder_series, name_series):
+    """Joins folder and name columns into relative link paths, skipping '.' folders."""
+
+    folder_str = folder_series.astype(str)
+
+    return (folder_str + "/" + name_series).mask(folder_str == ".", name_series)
+
+
+def fast_to_excel(df, path):
+    """Writes a frame as xlsx through openpyxl's write-only mode, which streams
+       rows out instead of building a Cell object per value like to_excel does.
+       Values openpyxl cannot store directly (e.g. Path objects) become strings,
+       matching what to_excel would have written."""
+
+    supported_types = (int, float, bool, str, datetime, type(None))
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    worksheet.append(list(df.columns))
+
+    for row in df.itertuples(index=False, name=None):
+        worksheet.append([value if isinstance(value, supported_types) else str(value) for value in row])
+
+    workbook.save(path)
+
+
+def scan_files(root):
+    """Yields a DirEntry for every file under root via an iterative scandir walk.
+       Much cheaper than rglob plus per-path is_dir/stat calls, since the entries
+       come straight from directory enumeration and cache their stat results."""
+
+    stack = [os.fspath(root)]
+
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    yield entry
+
+
 def create_initial_spreadsheet(input, sites_bool):
     """The result of this function is a not-yet organized spreadsheet with information regarding the inputted directory structure.
        If sites_bool is true, the sites.yaml is referenced to provide site information associated with images and a site table is created."""
@@ -105,13 +156,15 @@ def create_initial_spreadsheet(input, sites_bool):
             'input-image-folder': [],
         }
 
-    for folder in input.glob("**/"):
-        for file in folder.iterdir():
-            # if the file is an image
-            if any(file.name.lower().endswith(extension) for extension in INPUT_IMAGE_EXTENSIONS):
-                modified_folder = folder.relative_to(input)
+    # one os.walk pass instead of a recursive glob plus a per-folder iterdir
+    for root, dirs, files in os.walk(input):
+        folder = Path(root)
+        modified_folder = folder.relative_to(input)
 
-                data['input-image-name'].append(file.name)
+        for file_name in files:
+            # if the file is an image
+            if os.path.splitext(file_name)[1].lower() in INPUT_IMAGE_SUFFIXES:
+                data['input-image-name'].append(file_name)
                 data['input-image-folder'].append(modified_folder)
 
             if sites_bool:
@@ -124,11 +177,10 @@ def create_initial_spreadsheet(input, sites_bool):
                         site_descriptors_check = site_descriptors.copy()
                         site_dict = outer_site_dict[site]
 
-                        date = date_dir.name
-                        date_obj = datetime.strptime(date, "%Y-%m-%d")
                         photographer = folder.name
 
-                        data["date"].append(date_obj)
+                        # raw date strings here; the whole column is parsed once below
+                        data["date"].append(date_dir.name)
                         data["photographer"].append(photographer)
 
                         for descriptor, value in site_dict.items():
@@ -142,6 +194,10 @@ def create_initial_spreadsheet(input, sites_bool):
     df = pd.DataFrame(data)
 
     if sites_bool:
+        # one vectorized parse of the date column; with an explicit format and
+        # the cache, repeated folder dates are only parsed once
+        df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d", cache=True)
+
         sites_df = df.drop(columns=["date", "photographer", "input-image-name", "input-image-folder"])
         sites_df = sites_df.drop_duplicates()
     else:
@@ -164,70 +220,58 @@ def create_output_directory_and_spreadsheet(input, output, df, sites_df, sites_b
 
     print("Extracting time and location data...")
 
-    df["date-time"] = None
-    df["latitude"] = None
-    df["longitude"] = None
-    df["altitude-m"] = None
-    df["direction-deg"] = None
-    df["latitude-reference"] = None
-    df["longitude-reference"] = None
-    df["altitude-m-reference"] = None
-    df["direction-deg-reference"] = None
-    df["output-image-folder"] = None
-    df["output-image-name"] = None
-    df["output-image-link"] = None
-    df["TEMP-image-to-copy"] = None
-
     num_images = df.shape[0]
     temp_folder = "temp"
 
-    for i, image in df.iterrows():
-        print(f"Extracting metadata from image {i+1}/{num_images}", end="\r", flush=True)
+    # temp names are reserved under a lock so parallel conversions of images
+    # with the same stem cannot collide in the temp folder
+    temp_dir = output / temp_folder
+    temp_name_lock = threading.Lock()
+    reserved_temp_paths = set()
+
+    def reserve_temp_path(pre_extension):
+        jpeg_extension = ".JPEG"
+
+        with temp_name_lock:
+            file_path = temp_dir / (pre_extension + jpeg_extension)
+            counter = 1
 
-        input_folder = image["input-image-folder"]
-        input_name = image["input-image-name"]
+            # make sure we aren't overwriting image files
+            # (same name and different extensions prior to being put in temp folder)
+            while file_path in reserved_temp_paths or file_path.exists():
+                file_path = temp_dir / f"{pre_extension}_{counter}{jpeg_extension}"
+                counter += 1
+
+            reserved_temp_paths.add(file_path)
+
+        return file_path
+
+    def extract_image_metadata(row):
+        """Converts one image if needed and pulls its exif time and location data.
+           Returns one result tuple per image; failed conversions return the defaults."""
+
+        input_folder, input_name = row
 
         input_file_path = input / input_folder / input_name
         image_file_path = None
         image_to_copy = None
 
+        defaults = (None, np.nan, np.nan, np.nan, np.nan, None, None, np.nan, None, None)
+
         pre_extension = Path(input_name).stem
         file_extension = Path(input_name).suffix
 
-        try:
-            file_info = subprocess.run(["file", input_file_path], capture_output=True, text=True, check=True)
-            file_info = file_info.stdout.strip()
-            actual_file_type = file_info.split(":")[1].split(",")[0].strip()
-        except (FileNotFoundError, subprocess.CalledProcessError, IndexError):
-            # Fallback for Windows
-            try:
-                with PILImage.open(input_file_path) as img:
-                    actual_file_type = f"{img.format} image data"
-            except Exception as e:
-                actual_file_type = "Unknown"
-
         METADATA_READY = False
 
-        if actual_file_type.lower().startswith("jpeg"):
+        # a JPEG SOI marker check replaces the `file` subprocess per image
+        if is_jpeg(input_file_path):
             image_file_path = input_file_path
             METADATA_READY = True
 
         NOT_JPEG_BUT_READY = (file_extension.lower() not in ['.jpg', '.jpeg']) and METADATA_READY
 
         if (not METADATA_READY) or NOT_JPEG_BUT_READY:
-            jpeg_extension = ".JPEG"
-            temp_name = pre_extension + jpeg_extension
-            file_path = output / temp_folder / temp_name
-
-            # the below and the while loop are to make sure we aren't overwriting image files
-            # (same name and different extensions prior to being put in temp folder)
-            image_base = output / temp_folder / pre_extension
-            counter = 1
-
-            while file_path.exists():
-                new_name = f"{image_base}_{counter}{jpeg_extension}"
-                file_path = Path(new_name) 
-                counter += 1
+            file_path = reserve_temp_path(pre_extension)
 
             if not METADATA_READY:
                 image_file_path = file_path
@@ -242,14 +286,15 @@ def create_output_directory_and_spreadsheet(input, output, df, sites_df, sites_b
             except Exception as e:
                 # get rid of the below print statement eventually
                 print(f"An unexpected error occurred while converting this image to JPEG: {input_file_path}: {e}")
-                continue
+                return defaults
         else:
             image_to_copy = input_file_path
 
-        df.at[i, "TEMP-image-to-copy"] = image_to_copy
-
         with open(image_file_path, "rb") as image_file:
-            tags = exifread.process_file(image_file)
+            # stop_tag takes the short tag name, and GPSImgDirection (0x0011) is the
+            # highest-numbered GPS tag read below, so parsing can stop once it is
+            # seen; the thumbnail/makernote details are never needed
+            tags = exifread.process_file(image_file, details=False, stop_tag="GPSImgDirection")
 
         try:
             time = tags.get("EXIF DateTimeOriginal").values
@@ -306,16 +351,47 @@ def create_output_directory_and_spreadsheet(input, output, df, sites_df, sites_b
         except AttributeError:
             direction_ref = None
 
-        df.at[i, "date-time"] = time_obj
-        df.at[i, "latitude"] = decimal_lat
-        df.at[i, "longitude"] = decimal_long
-        df.at[i, "altitude-m"] = decimal_altitude
-        df.at[i, "direction-deg"] = decimal_direction
-        
-        df.at[i, "latitude-reference"] = lat_ref
-        df.at[i, "longitude-reference"] = long_ref
-        df.at[i, "altitude-m-reference"] = altitude_ref
-        df.at[i, "direction-deg-reference"] = direction_ref
+        return (time_obj, decimal_lat, decimal_long, decimal_altitude, decimal_direction,
+                lat_ref, long_ref, altitude_ref, direction_ref, image_to_copy)
+
+    # the conversion and exif parsing per image are independent and spend most
+    # of their time in file reads, so they run across a thread pool
+    input_rows = df[["input-image-folder", "input-image-name"]].itertuples(index=False, name=None)
+    results = []
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for i, result in enumerate(executor.map(extract_image_metadata, input_rows)):
+            print(f"Extracting metadata from image {i+1}/{num_images}", end="\r", flush=True)
+            results.append(result)
+
+    if results:
+        (times, lats, longs, altitudes, directions,
+         lat_refs, long_refs, altitude_refs, direction_refs, images_to_copy) = (list(column) for column in zip(*results))
+    else:
+        times = lats = longs = altitudes = directions = []
+        lat_refs = long_refs = altitude_refs = direction_refs = images_to_copy = []
+
+    # bulk column assignment, one per extracted field
+    # the numeric fields go in as float64 arrays; list inference would fall
+    # back to object dtype when exifread hands back rational values
+    df["date-time"] = times
+    df["latitude"] = np.asarray(lats, dtype="float64")
+    df["longitude"] = np.asarray(longs, dtype="float64")
+    df["altitude-m"] = np.asarray(altitudes, dtype="float64")
+    df["direction-deg"] = np.asarray(directions, dtype="float64")
+    df["latitude-reference"] = lat_refs
+    df["longitude-reference"] = long_refs
+    df["altitude-m-reference"] = altitude_refs
+    df["direction-deg-reference"] = direction_refs
+
+    df["output-image-folder"] = None
+    df["output-image-name"] = None
+    df["output-image-link"] = None
+
+    # the paths to copy live in a plain dict keyed by the pre-sort row index;
+    # keeping the Path objects out of the frame avoids an object column riding
+    # through the sorting and reordering below
+    paths_to_copy = dict(enumerate(images_to_copy))
 
     print("\n✅\n")
 
@@ -324,8 +400,7 @@ def create_output_directory_and_spreadsheet(input, output, df, sites_df, sites_b
     df["date-time"] = pd.to_datetime(df["date-time"])
 
     if sites_bool:
-        df["date"] = pd.to_datetime(df["date"])
-
+        # the date column is already datetime64 from create_initial_spreadsheet
         df["date-time"] = df["date-time"].fillna(df["date"])
         df.drop('date', axis=1, inplace=True)
 
@@ -335,106 +410,63 @@ def create_output_directory_and_spreadsheet(input, output, df, sites_df, sites_b
     df.sort_values(by="date-time", ascending=True, inplace=True)
 
     if sites_bool:
-        # determining site ids
+        # determining site ids, zero-padded to the widest site number
         order_of_sites = pd.unique(df["site-name"])
-        num_sites = len(order_of_sites)
-        num_sites_len = len(str(num_sites))
-
-        site_id_dict = {}
-
-        for index, site in enumerate(order_of_sites):
-            site_number = index + 1
-            index_len = len(str(site_number))
-            site_id = "S"
-            for i in range(num_sites_len - index_len):
-                site_id += "0"
-            site_id += str(site_number)
-            
-            site_id_dict[site] = site_id
+        num_sites_len = len(str(len(order_of_sites)))
 
-        df["site-id"] = None
+        site_id_dict = {site: "S" + str(index + 1).zfill(num_sites_len)
+                        for index, site in enumerate(order_of_sites)}
 
-        for i, image in df.iterrows():
-            site_name = image["site-name"]
-            site_id = site_id_dict[site_name]
-            df.at[i, "site-id"] = site_id
-
-        sites_df["site-id"] = None
-
-        for j, site in sites_df.iterrows():
-            site_name = site["site-name"]
-            site_id = site_id_dict[site_name]
-            sites_df.at[j, "site-id"] = site_id
+        df["site-id"] = df["site-name"].map(site_id_dict)
+        sites_df["site-id"] = sites_df["site-name"].map(site_id_dict)
 
     num_images_len = len(str(num_images))
 
+    # the pre-sort row order, so paths_to_copy lookups still work after the sort
+    original_order = df.index.to_numpy()
+
     df.reset_index(drop=True, inplace=True)
     df['photo-id'] = "P" + (df.index + 1).astype(str).str.zfill(num_images_len)
 
-    # loop to copy and rename images, as well as fill in output columns
-    for i, image in df.iterrows():
-        print(f"Copying image {i+1}/{num_images}", end="\r", flush=True)
-
-        image_to_copy = image["TEMP-image-to-copy"]
-        date_time = image["date-time"]
-        date_for_name = ""
+    # building the output folders and names as whole columns; only the copy itself loops
+    # "NODATE" marks images whose date-time could not be determined
+    date_for_name = df["date-time"].dt.strftime("%Y%m%d").fillna("NODATE")
+    extensions = pd.Series([paths_to_copy[original].suffix for original in original_order], index=df.index)
 
-        # haven't been able to test this yet
-        if pd.isna(date_time):
-            date_for_name = "NODATE"
-        else:
-            date_for_name = date_time.strftime("%Y%m%d")
-
-        photo_id = image["photo-id"]
-
-        extension = image_to_copy.suffix
-
-        if sites_bool:
-            site_id = image["site-id"]
-
-            # the below variable and for loop are to get the city variable in case the casing is not what is anticipated
-            city_col_name = ""
+    if sites_bool:
+        # this is to get the city column in case the casing is not what is anticipated
+        city_col_name = next(col_name for col_name in df.columns if col_name.lower() == "city")
 
-            col_names = df.columns.tolist()
+        first_word_site = df["site-name"].str.split().str[0]
 
-            for col_name in col_names:
-                if col_name.lower() == "city":
-                    city_col_name = col_name
-                    break
+        def photographer_for_name(photographer):
+            names = [name for name in re.split(r'[ -]', photographer) if name] # the if name is to avoid empty strings
 
-            city = image[city_col_name]
+            if len(names) >= 2:
+                return "".join(name[0].upper() for name in names) # this generates initials
 
-            site_name = image["site-name"]
-            first_word_site = site_name.split()[0]
+            return photographer
 
-            photographer = image["photographer"]
-            names = re.split(r'[ -]', photographer)
-            name_count = len([name for name in names if name]) # the if name is to avoid empty strings
+        photographer_names = df["photographer"].map(photographer_for_name)
 
-            if name_count >= 2:
-                photographer_name = [name[0].upper() for name in names if name] # this generates initials
-            else:
-                photographer_name = photographer
-
-            output_folder = city
-            output_name = date_for_name + "_" + site_id + "-" + photo_id + "_" + city + "_" + first_word_site + "_" + photographer_name + extension
-        else:
-            input_folder = image["input-image-folder"]
+        df["output-image-folder"] = df[city_col_name]
+        df["output-image-name"] = (date_for_name + "_" + df["site-id"] + "-" + df["photo-id"] + "_"
+                                   + df[city_col_name] + "_" + first_word_site + "_" + photographer_names + extensions)
+    else:
+        df["output-image-folder"] = df["input-image-folder"]
+        df["output-image-name"] = date_for_name + "_" + df["photo-id"] + extensions
 
-            output_folder = input_folder
-            output_name = date_for_name + "_" + photo_id + extension
-            
-        output_file_path = output / output_folder / output_name
+    # loop to copy images into the output directory
+    copy_rows = zip(original_order, df["output-image-folder"], df["output-image-name"])
 
-        convert_and_preserve_image_metadata(image_to_copy, output_file_path)
+    for i, (original, output_folder, output_name) in enumerate(copy_rows):
+        print(f"Copying image {i+1}/{num_images}", end="\r", flush=True)
 
-        df.at[i, "output-image-folder"] = output_folder
-        df.at[i, "output-image-name"] = output_name
+        convert_and_preserve_image_metadata(paths_to_copy[original], output / output_folder / output_name)
 
-    df['output-image-link'] = df.apply(
-        lambda row: f'=HYPERLINK("{Path("..") / Path(row["output-image-folder"]) / row["output-image-name"]}", "{row["output-image-name"]}")', 
-        axis=1
-    )
+    # link column built with whole-column string concatenation, no per-row lambda
+    output_rel = relative_link_path(df["output-image-folder"], df["output-image-name"])
+    df['output-image-link'] = '=HYPERLINK("../' + output_rel + '", "' + df["output-image-name"] + '")'
 
     temp_dir = output / temp_folder
 
@@ -444,8 +476,6 @@ def create_output_directory_and_spreadsheet(input, output, df, sites_df, sites_b
         
         temp_dir.rmdir()
 
-    df.drop('TEMP-image-to-copy', axis=1, inplace=True)
-
     df.insert(0, "photo-id", df.pop("photo-id"))
 
     datetime_col = df.columns.get_loc("date-time")
@@ -465,6 +495,23 @@ def create_output_directory_and_spreadsheet(input, output, df, sites_df, sites_b
         sites_df.insert(0, "site-id", sites_df.pop("site-id"))
         sites_df.insert(1, "site-name", sites_df.pop("site-name"))
 
+    # low-cardinality repeating strings shrink to categorical codes
+    # (done after the name building above, which needs plain string concat)
+    category_columns = ["photographer", "site-name", "latitude-reference",
+                        "longitude-reference", "direction-deg-reference"]
+
+    if sites_bool:
+        category_columns.append(city_col_name)
+
+    for column in category_columns:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+
+    if sites_bool:
+        for column in ["site-name", city_col_name]:
+            if column in sites_df.columns:
+                sites_df[column] = sites_df[column].astype("category")
+
     print("\n✅\n")
 
     return df, sites_df
@@ -537,48 +584,83 @@ def delete_similar_images(input, output, df, sites_bool, delete_threshold):
 
     image_paths = []
 
-    # getting all image paths
-    for file in output.rglob("*"):
-        if file.is_dir():
-            continue
-            
-        if any(file.name.lower().endswith(extension) for extension in OUTPUT_IMAGE_EXTENSIONS):
-            image_paths.append(file)
+    # getting all image paths in one os.walk pass
+    for root, dirs, files in os.walk(output):
+        for file_name in files:
+            if os.path.splitext(file_name)[1].lower() in OUTPUT_IMAGE_SUFFIXES:
+                image_paths.append(Path(root) / file_name)
+
+    # with sites, only images within the same site are ever candidates for
+    # deletion, so images are grouped by site id and cross-site pairs are
+    # never computed; sites with a single image are skipped entirely
+    if sites_bool:
+        site_groups = defaultdict(list)
+
+        for path in image_paths:
+            site_id = path.name.split("_")[1].split("-")[0]
+            site_groups[site_id].append(path)
+
+        comparison_groups = [group for group in site_groups.values() if len(group) >= 2]
+    else:
+        comparison_groups = [image_paths]
+
+    # exact duplicates (same size, then same content hash) are paired at
+    # similarity 1.0 without going through the model; only one representative
+    # per duplicate group continues on to feature extraction
+    exact_pairs = []
+    nn_groups = []
+
+    for group in comparison_groups:
+        size_groups = defaultdict(list)
+
+        for path in group:
+            size_groups[path.stat().st_size].append(path)
+
+        duplicate_paths = set()
+
+        for same_size_paths in size_groups.values():
+            if len(same_size_paths) < 2:
+                continue
+
+            # hashing only runs within same-size groups
+            hash_groups = defaultdict(list)
+
+            for path in same_size_paths:
+                with open(path, "rb") as file:
+                    hash_groups[hashlib.file_digest(file, "blake2b").digest()].append(path)
 
-    num_images = len(image_paths)
+            for matching_paths in hash_groups.values():
+                if len(matching_paths) < 2:
+                    continue
 
-    feature_vectors = {}
+                # pairing every combination lets the deletion selection keep one
+                for first_image, second_image in combinations(matching_paths, 2):
+                    exact_pairs.append((first_image, second_image, 1.0))
 
-    # getting feature vectors for images
-    for i, path in enumerate(image_paths):
-        print(f"Getting feature vector for image {i+1}/{num_images}", end="\r", flush=True)
+                duplicate_paths.update(matching_paths[1:])
 
-        vector = get_feature_vector(path, model, transform)
-        feature_vectors[path] = vector
+        nn_groups.append([path for path in group if path not in duplicate_paths])
+
+    comparison_groups = nn_groups
+
+    images_to_embed = [path for group in comparison_groups for path in group]
+
+    # getting feature vectors for images in batches, one forward pass per batch
+    feature_vectors = get_feature_vectors(images_to_embed, model, transform)
 
     print()
 
     # this keeps track of images in df to update after deletion
     index_of_images_in_df = {}
 
-    # creating data dictionary to be turned into df
-    data = {}
-
     # the ones that say input refer to input images, otherwise, they refer to output images
-    data["input-image-1-folder"] = [] 
-    data["input-image-1-name"] = []
-    data["input-image-2-folder"] = []
-    data["input-image-2-name"] = []
-    data["image-1-folder"] = [] 
-    data["image-1-name"] = []
-    data["image-1"] = []
-    data["image-2-folder"] = []
-    data["image-2-name"] = []
-    data["image-2"] = []
-    data["similarity"] = []
-
-    if sites_bool:
-        data["same-site"] = []
+    similarity_columns = [
+        "input-image-1-folder", "input-image-1-name",
+        "input-image-2-folder", "input-image-2-name",
+        "image-1-folder", "image-1-name", "image-1",
+        "image-2-folder", "image-2-name", "image-2",
+        "similarity",
+    ]
 
     # adding column to image table to indicate if each image had image(s) similar to it that were deleted
     df['similar-image-deleted'] = False
@@ -588,86 +670,93 @@ def delete_similar_images(input, output, df, sites_bool, delete_threshold):
     df.insert(direction_ref_loc + 1, "similar-image-deleted", df.pop("similar-image-deleted"))
     
     # comparing image feature vectors
-    for i in range(len(image_paths)):
-        for j in range(i + 1, len(image_paths)):
-            print(f"Comparing images {i+1} and {j+1}", end="\r", flush=True)
-
-            first_image = image_paths[i]
-            second_image = image_paths[j]
-
-            vec1 = feature_vectors[first_image]
-            vec2 = feature_vectors[second_image]
-
-            if vec1 is not None and vec2 is not None:
-                similarity = cosine_similarity([vec1], [vec2])[0][0]
-
-                # if they are sufficiently similar, add image information as a row in df
-                if similarity >= delete_threshold:
-                    first_parent = first_image.parent
-                    first_folder = first_parent.relative_to(output)
-                    first_image_name = first_image.name
-
-                    second_parent = second_image.parent
-                    second_folder = second_parent.relative_to(output)
-                    second_image_name = second_image.name
-
-                    data["image-1-folder"].append(first_folder)
-                    data["image-1-name"].append(first_image_name)
-                    data["image-1"].append(first_image)
-                    data["image-2-folder"].append(second_folder)
-                    data["image-2-name"].append(second_image_name)
-                    data["image-2"].append(second_image)
-                    data["similarity"].append(similarity)
-
-                    first_image_index = df.index[df['output-image-name'] == first_image_name][0]
-                    second_image_index = df.index[df['output-image-name'] == second_image_name][0]
-
-                    if first_image not in index_of_images_in_df:
-                        index_of_images_in_df[first_image] = first_image_index
-                    if second_image not in index_of_images_in_df:
-                        index_of_images_in_df[second_image] = second_image_index
-
-                    # adding input image information to df
-                    data["input-image-1-folder"].append(df.at[first_image_index, "input-image-folder"])
-                    data["input-image-1-name"].append(df.at[first_image_index, "input-image-name"])
-                    data["input-image-2-folder"].append(df.at[second_image_index, "input-image-folder"])
-                    data["input-image-2-name"].append(df.at[second_image_index, "input-image-name"])
-
-                    if sites_bool:
-                        first_site = first_image_name.split("_")[1].split("-")[0]
-                        second_site = second_image_name.split("_")[1].split("-")[0]
-
-                        if first_site == second_site:
-                            data["same-site"].append(True)
-                        else:
-                            data["same-site"].append(False)
-
-    similarity_df = pd.DataFrame(data)
+    # all pairwise cosine similarities come out of one normalized matrix product
+    # rather than one sklearn call per pair
+    print("Comparing feature vectors...", end="\r", flush=True)
+
+    similar_pairs = list(exact_pairs)
+
+    for group in comparison_groups:
+        valid_paths = [path for path in group if feature_vectors[path] is not None]
+
+        if len(valid_paths) < 2:
+            continue
+
+        feature_matrix = np.stack([feature_vectors[path] for path in valid_paths]).astype(np.float32)
+        feature_matrix /= np.linalg.norm(feature_matrix, axis=1, keepdims=True) + 1e-12
+
+        # the product runs in row blocks so memory stays bounded on large image
+        # sets, instead of materializing the full N-by-N similarity matrix
+        BLOCK_SIZE = 1024
+
+        for start in range(0, len(valid_paths), BLOCK_SIZE):
+            block = feature_matrix[start:start + BLOCK_SIZE] @ feature_matrix.T
+            block_rows, block_cols = np.where(block >= delete_threshold)
+
+            # keep only the upper triangle of the full matrix
+            upper = block_cols > block_rows + start
+            block_rows, block_cols = block_rows[upper], block_cols[upper]
+
+            for i, j, similarity in zip(block_rows + start, block_cols, block[block_rows, block_cols]):
+                similar_pairs.append((valid_paths[i], valid_paths[j], similarity))
+
+    # one hash lookup per name instead of a full-column scan per hit
+    name_to_index = dict(zip(df['output-image-name'], df.index))
+
+    # one record per sufficiently similar pair; the frame is built in a single
+    # from_records call instead of growing parallel column lists
+    records = []
+
+    for first_image, second_image, similarity in similar_pairs:
+        first_image_name = first_image.name
+        second_image_name = second_image.name
+
+        first_image_index = name_to_index[first_image_name]
+        second_image_index = name_to_index[second_image_name]
+
+        if first_image not in index_of_images_in_df:
+            index_of_images_in_df[first_image] = first_image_index
+        if second_image not in index_of_images_in_df:
+            index_of_images_in_df[second_image] = second_image_index
+
+        records.append((
+            df.at[first_image_index, "input-image-folder"],
+            df.at[first_image_index, "input-image-name"],
+            df.at[second_image_index, "input-image-folder"],
+            df.at[second_image_index, "input-image-name"],
+            first_image.parent.relative_to(output),
+            first_image_name,
+            first_image,
+            second_image.parent.relative_to(output),
+            second_image_name,
+            second_image,
+            similarity,
+        ))
+
+    similarity_df = pd.DataFrame.from_records(records, columns=similarity_columns)
     num_pairs = len(similarity_df)
 
     print()
     print(f"\nFound {num_pairs} pairs of similar images.")
 
     # creating hyperlinks for input and output image pairs
-    similarity_df['input-image-1-link'] = similarity_df.apply(
-        lambda row: f'=HYPERLINK("{Path(os.path.relpath(input / Path(row["input-image-1-folder"]) / row["input-image-1-name"], start=output / "_SIMILAR_IMAGES"))}", "{row["input-image-1-name"]}")', 
-        axis=1
-    )
+    # the common relative prefix back to the input directory is computed once;
+    # the link columns are whole-column string concatenations
+    input_prefix = Path(os.path.relpath(input, start=output / "_SIMILAR_IMAGES")).as_posix()
 
-    similarity_df['input-image-2-link'] = similarity_df.apply(
-        lambda row: f'=HYPERLINK("{Path(os.path.relpath(input / Path(row["input-image-2-folder"]) / row["input-image-2-name"], start=output / "_SIMILAR_IMAGES"))}", "{row["input-image-2-name"]}")', 
-        axis=1
-    )
+    input_1_rel = relative_link_path(similarity_df["input-image-1-folder"], similarity_df["input-image-1-name"])
+    similarity_df['input-image-1-link'] = ('=HYPERLINK("' + input_prefix + '/' + input_1_rel
+                                           + '", "' + similarity_df["input-image-1-name"] + '")')
 
-    similarity_df['image-1-link'] = similarity_df.apply(
-        lambda row: f'=HYPERLINK("{Path("..") / Path(row["image-1-folder"]) / row["image-1-name"]}", "{row["image-1-name"]}")', 
-        axis=1
-    )
+    input_2_rel = relative_link_path(similarity_df["input-image-2-folder"], similarity_df["input-image-2-name"])
+    similarity_df['input-image-2-link'] = ('=HYPERLINK("' + input_prefix + '/' + input_2_rel
+                                           + '", "' + similarity_df["input-image-2-name"] + '")')
 
-    similarity_df['image-2-link'] = similarity_df.apply(
-        lambda row: f'=HYPERLINK("{Path("..") / Path(row["image-2-folder"]) / row["image-2-name"]}", "{row["image-2-name"]}")', 
-        axis=1
-    )
+    image_1_rel = relative_link_path(similarity_df["image-1-folder"], similarity_df["image-1-name"])
+    similarity_df['image-1-link'] = '=HYPERLINK("../' + image_1_rel + '", "' + similarity_df["image-1-name"] + '")'
+
+    image_2_rel = relative_link_path(similarity_df["image-2-folder"], similarity_df["image-2-name"])
+    similarity_df['image-2-link'] = '=HYPERLINK("../' + image_2_rel + '", "' + similarity_df["image-2-name"] + '")'
 
     # inserting columns with links at a specific location (end of each little grouping)
     input_image_1_loc = similarity_df.columns.get_loc("input-image-1-name")
@@ -682,10 +771,6 @@ def delete_similar_images(input, output, df, sites_bool, delete_threshold):
     image_2_loc = similarity_df.columns.get_loc("image-2")
     similarity_df.insert(image_2_loc, "image-2-link", similarity_df.pop("image-2-link"))
 
-    if sites_bool:
-        diff_sites_df = similarity_df[similarity_df['same-site'] == False]
-        similarity_df = similarity_df[similarity_df['same-site'] == True]
-
     image_default_dict = defaultdict(set)
 
     for image_1, image_2 in zip(similarity_df['image-1'], similarity_df['image-2']):
@@ -695,63 +780,67 @@ def delete_similar_images(input, output, df, sites_bool, delete_threshold):
     # turning it into a normal dict
     image_dict = {key: list(value) for key, value in image_default_dict.items()}
 
-    # sorting by length of value lists to delete images with multiple matches first
-    image_dict = dict(sorted(image_dict.items(), key=lambda item: len(item[1]), reverse=True))
-    image_dict_to_modify = image_dict.copy()
-
-    image_delete_list = []
+    # a set keeps every membership check O(1), no matter how many deletions pile up
+    image_delete_set = set()
 
     # if image has 2 or more matches, delete it and update number of matches
-    while any(len(similar_images) >= 2 for similar_images in image_dict_to_modify.values()):
-        duplicate_image = next(iter(image_dict_to_modify))
-        similar_images = image_dict_to_modify[duplicate_image]
+    # a max-heap on match count (with lazy invalidation of stale entries)
+    # always yields the image with the most matches, without re-sorting the
+    # whole dict on every deletion
+    heap = [(-len(similar_images), image) for image, similar_images in image_dict.items()]
+    heapq.heapify(heap)
+
+    while heap:
+        neg_count, duplicate_image = heapq.heappop(heap)
+        similar_images = image_dict[duplicate_image]
+
+        # stale heap entry: the match count changed after this was pushed
+        if -neg_count != len(similar_images):
+            continue
+
+        if len(similar_images) < 2:
+            break
 
-        image_delete_list.append(duplicate_image)
-        image_dict_to_modify[duplicate_image] = []
+        image_delete_set.add(duplicate_image)
+        image_dict[duplicate_image] = []
 
         for image in similar_images:
-            image_dict_to_modify[image].remove(duplicate_image)
+            image_dict[image].remove(duplicate_image)
+            heapq.heappush(heap, (-len(image_dict[image]), image))
 
-        # sorting again in case we go through the loop again
-        image_dict_to_modify = dict(sorted(image_dict_to_modify.items(), key=lambda item: len(item[1]), reverse=True))
-
-    
-    image_deleted = []
 
     # at this point, we should only have one similar image per unique image
-    # loop through similarity df and add image_2's as the image to delete
-    # if one has not yet been deleted in the pair
-    for i, image in similarity_df.iterrows():
-        image_1 = image["image-1"]
-        image_2 = image["image-2"]
-
-        if (image_1 in image_delete_list) and (image_2 in image_delete_list):
-            image_deleted.append("both")
-        elif (image_1 in image_delete_list):
-            image_deleted.append("image-1")
-            # determining kept image
-            second_image_index = df.index[df['output-image-name'] == image["image-2-name"]][0]
-            df.loc[second_image_index, 'similar-image-deleted'] = True
-        elif (image_2 in image_delete_list):
-            image_deleted.append("image-2")
-            # determining kept image
-            first_image_index = df.index[df['output-image-name'] == image["image-1-name"]][0]
-            df.loc[first_image_index, 'similar-image-deleted'] = True
-        else:
-            image_delete_list.append(image_2)
-            image_deleted.append("image-2")
-            # determining kept image
-            first_image_index = df.index[df['output-image-name'] == image["image-1-name"]][0]
-            df.loc[first_image_index, 'similar-image-deleted'] = True
+    # pairs are classified against the delete list with boolean masks instead of
+    # a per-row iterrows pass
+    in_delete_1 = similarity_df["image-1"].isin(image_delete_set).to_numpy()
+    in_delete_2 = similarity_df["image-2"].isin(image_delete_set).to_numpy()
+
+    # pairs with neither side selected lose image-2; after the heap pass each
+    # remaining image has at most one match, so these rows share no images and
+    # the choices cannot interact
+    neither = ~in_delete_1 & ~in_delete_2
+    image_delete_set.update(similarity_df.loc[neither, "image-2"])
+    in_delete_2 |= neither
+
+    similarity_df["output-image-deleted"] = np.select(
+        [in_delete_1 & in_delete_2, in_delete_1],
+        ["both", "image-1"],
+        default="image-2",
+    )
 
-    similarity_df["output-image-deleted"] = image_deleted
+    # flagging the kept image of each pair in the image table
+    kept_names = pd.concat([
+        similarity_df.loc[in_delete_1 & ~in_delete_2, "image-2-name"],
+        similarity_df.loc[in_delete_2 & ~in_delete_1, "image-1-name"],
+    ])
+    df.loc[[name_to_index[name] for name in kept_names], "similar-image-deleted"] = True
 
-    num_images_to_delete = len(image_delete_list)
+    num_images_to_delete = len(image_delete_set)
 
     print(f"Deleting {num_images_to_delete} images...")
 
-    # actually deleting images and dropping rows corresponding to those images 
-    for image in image_delete_list:
+    # actually deleting images and dropping rows corresponding to those images
+    for image in image_delete_set:
         if image.exists():
             image.unlink()
 
@@ -766,64 +855,12 @@ def delete_similar_images(input, output, df, sites_bool, delete_threshold):
         inplace=True
     )
 
-    if sites_bool:
-        similarity_df.drop(
-            columns=["same-site"],
-            inplace=True
-        )
-
     sim_spreadsheet_name = output / "_SIMILAR_IMAGES" / "similarity_delete_table.xlsx"
     sim_spreadsheet_name.parent.mkdir(parents=True, exist_ok=True)
 
-    similarity_df.to_excel(sim_spreadsheet_name, index=False)
-
-    if sites_bool:
-        if len(diff_sites_df) > 0:
-            already_deleted_one_or_both = []
-
-            single_data = {}
-
-            single_data["image-folder"] = []
-            single_data["image-name"] = []
-            single_data["image-link"] = []
-
-            for i, image in diff_sites_df.iterrows():
-                image_1 = image["image-1"]
-                image_2 = image["image-2"]
-
-                if (image_1 in image_delete_list) and (image_2 in image_delete_list):
-                    already_deleted_one_or_both.append(i)
-                elif image_1 in image_delete_list:
-                    already_deleted_one_or_both.append(i)
-                    
-                    single_data["image-folder"].append(image["image-2-folder"])
-                    single_data["image-name"].append(image["image-2-name"])
-                    single_data["image-link"].append(image["image-2-link"])
-                elif image_2 in image_delete_list:
-                    already_deleted_one_or_both.append(i)
-                    
-                    single_data["image-folder"].append(image["image-1-folder"])
-                    single_data["image-name"].append(image["image-1-name"])
-                    single_data["image-link"].append(image["image-1-link"])
-
-            # this is for if we delete one of a pair of images in which the pair were of different sites
-            # these images' sites may need reclassified
-            if len(single_data['image-name']) > 0:
-                verify_city_df = pd.DataFrame(single_data)
-                spreadsheet_name = output / "_SIMILAR_IMAGES" / "verify_site_ids.xlsx"
-                verify_city_df.to_excel(spreadsheet_name, index=False)
-
-            if len(already_deleted_one_or_both) > 0:
-                diff_sites_df = diff_sites_df.drop(already_deleted_one_or_both)
-
-            if len(diff_sites_df) > 0:
-                diff_sites_df.drop(
-                    columns=["input-image-1-link", "input-image-2-link", "image-1", "image-2", "same-site"], 
-                    inplace=True
-                )
-
-                spreadsheet_name = output / "_SIMILAR_IMAGES" / "similar_images_different_sites.xlsx"
-                diff_sites_df.to_excel(spreadsheet_name, index=False)
+    # the similarity table can run to hundreds of thousands of pairs, so it
+    # goes through the streaming writer rather than to_excel
+    fast_to_excel(similarity_df, sim_spreadsheet_name)
 
     return df
 
@@ -834,90 +871,89 @@ def compress_images(output, max_size_gb):
     print("Getting image sizes and preparing to compress...")
 
     image_paths = []
+    image_sizes = []
 
-    for file in output.rglob("*"):
-        if file.is_dir():
-            continue
-            
-        if any(file.name.lower().endswith(extension) for extension in OUTPUT_IMAGE_EXTENSIONS):
-            image_paths.append(Path(file))
+    for entry in scan_files(output):
+        if os.path.splitext(entry.name)[1].lower() in OUTPUT_IMAGE_SUFFIXES:
+            image_paths.append(Path(entry.path))
+            image_sizes.append(entry.stat().st_size / (1024**2))
 
-    image_sizes = []
+    # two parallel arrays sorted by one argsort; no dataframe needed here
+    image_paths = np.array(image_paths, dtype=object)
+    image_sizes = np.asarray(image_sizes, dtype=np.float64)
 
-    for image in image_paths:
-        size_bytes = image.stat().st_size
-        size_mb = size_bytes / (1024**2)
-        image_sizes.append(size_mb)
+    order = np.argsort(image_sizes, kind="stable")
+    image_paths = image_paths[order]
+    image_sizes = image_sizes[order]
 
-    size_df = pd.DataFrame({'image-file-path': image_paths, 'image-size': image_sizes})
-    size_df = size_df.sort_values(by='image-size', ascending=True)
-    size_df.reset_index(inplace=True, drop=True)
+    # one figure reused for both histograms, skipping pyplot's stateful machinery
+    figure = Figure()
+    axes = figure.add_subplot()
 
     # saving a figure of the image distribution for reference
-    plt.hist(size_df['image-size'], bins=30)
+    axes.hist(image_sizes, bins=30)
 
-    plt.xlabel("Image Size (MB)")
-    plt.ylabel("Frequency")
+    axes.set_xlabel("Image Size (MB)")
+    axes.set_ylabel("Frequency")
 
     pre_compress_fig_name = output / "_IMAGE_SIZE_DISTRIBUTIONS" / "PRE_compress_image_size_dist.svg"
     pre_compress_fig_name.parent.mkdir(parents=True, exist_ok=True)
 
-    plt.savefig(pre_compress_fig_name)
-    plt.clf()
+    figure.savefig(pre_compress_fig_name)
+    axes.cla()
 
     MAX_TOT_SIZE_MB = max_size_gb * 1024
-    num_images = len(size_df)
-
-    FIRST_IMAGE_NEEDING_COMPRESSED = True
-
-    data_to_work_with = MAX_TOT_SIZE_MB
-    images_to_go = num_images
-    images_to_compress = 0
-    index = 1
-    # initially, the max size of an image assumes that all images have equal size
-    max_pic_size_mb = calc_max_pic_size(images_to_go, MAX_TOT_SIZE_MB)
-
-    # the max size increases as we iterate through a dataframe that is sorted in ascending order
-    # images that are smaller than the average size will not need compressed and free up more space for larger images
-    for i, image in size_df.iterrows():
-        image_size = size_df.at[i, "image-size"]
-    
-        if image_size <= max_pic_size_mb:
-            data_to_work_with -= image_size
-            images_to_go -= 1
-            # max size increases while images are smaller than the average size needed
-            max_pic_size_mb = calc_max_pic_size(images_to_go, data_to_work_with)
-        else:
-            # here we will want to compress images
-
-            # once we hit our first image larger than the max size, the size to reduce to is set
-            # all future images will need to be reduced to size_reduction
-            if FIRST_IMAGE_NEEDING_COMPRESSED:
-                size_reduction = math.floor(max_pic_size_mb * 100) / 100
-                FIRST_IMAGE_NEEDING_COMPRESSED = False
+    num_images = len(image_sizes)
+
+    # the running budget is a deterministic function of the sorted sizes, so the
+    # max size allowed at each position comes from one prefix-sum pass:
+    # what is left after keeping the smaller images, spread over the images to go
+    # images smaller than the average size free up more space for larger images
+    if num_images:
+        spent_before = np.concatenate(([0.0], np.cumsum(image_sizes[:-1])))
+        remaining_counts = num_images - np.arange(num_images)
+        max_pic_sizes = (MAX_TOT_SIZE_MB - spent_before) / remaining_counts
+
+        needs_compression = image_sizes > max_pic_sizes
+    else:
+        needs_compression = np.zeros(0, dtype=bool)
 
-                images_to_compress = images_to_go
-                print(f"Images larger than {size_reduction} MB will be compressed.")
+    if needs_compression.any():
+        # the sizes are ascending, so every image from the first over-budget one
+        # on needs to be reduced to the max size set at that point
+        first_over_budget = int(np.argmax(needs_compression))
+        size_reduction = math.floor(max_pic_sizes[first_over_budget] * 100) / 100
 
-            print(f"Compressing image {index}/{images_to_compress}", end="\r", flush=True)
+        rows_to_compress = range(first_over_budget, num_images)
+        images_to_compress = len(rows_to_compress)
+        print(f"Images larger than {size_reduction} MB will be compressed.")
+    else:
+        rows_to_compress = []
+        # keeps the existing "already below the threshold" message
+        calc_max_pic_size(0, MAX_TOT_SIZE_MB)
 
-            new_size = reduce_image(size_df.at[i, "image-file-path"], size_reduction, step=5)
-            size_df.at[i, "image-size"] = new_size
+    # the reductions are independent and CPU-bound in the JPEG encoder,
+    # so they fan out across one worker process per core
+    if rows_to_compress:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = {executor.submit(reduce_image, image_paths[i], size_reduction): i
+                       for i in rows_to_compress}
 
-            index += 1
+            for index, future in enumerate(as_completed(futures), start=1):
+                print(f"Compressing image {index}/{images_to_compress}", end="\r", flush=True)
+                image_sizes[futures[future]] = future.result()
 
     print("\n✅\n")
-    
-    plt.hist(size_df['image-size'], bins=30)
 
-    plt.xlabel("Image Size (MB)")
-    plt.ylabel("Frequency")
+    axes.hist(image_sizes, bins=30)
+
+    axes.set_xlabel("Image Size (MB)")
+    axes.set_ylabel("Frequency")
 
     # saving a figure of the image distribution for reference
     post_compress_fig_name = output / "_IMAGE_SIZE_DISTRIBUTIONS" / "POST_compress_image_size_dist.svg"
 
-    plt.savefig(post_compress_fig_name)
-    plt.clf()
+    figure.savefig(post_compress_fig_name)
 
     # issue with image orientation being lost in reduced images
 
@@ -928,24 +964,43 @@ def create_map(output, df, sites_bool):
     print("Creating image map...")
 
     # only mapping images with a location
-    df_no_nan = df.dropna(subset=["latitude", "longitude"])
+    # the copy makes this an independent frame, so the column assignments below
+    # don't warn about writing into a slice of df
+    df_no_nan = df.dropna(subset=["latitude", "longitude"]).copy()
     # excluding the folder columns and the hyperlink since they can cause problems if they have "\"
     excluded_columns = {"input-image-folder", "output-image-folder", "output-image-link"}
 
+    # hemisphere sign flips applied to the whole columns up front
+    df_no_nan["latitude"] = (np.where(df_no_nan["latitude-reference"].to_numpy() == "S", -1.0, 1.0)
+                             * df_no_nan["latitude"].to_numpy())
+    df_no_nan["longitude"] = (np.where(df_no_nan["longitude-reference"].to_numpy() == "W", -1.0, 1.0)
+                              * df_no_nan["longitude"].to_numpy())
+
     image_map = folium.Map(location=[0, 0], zoom_start=2)
 
-    # to check if there is already an image on the map at a location where another image is being displayed
-    existing_locations = set()
+    # markers go into a cluster layer so the browser only renders what is in
+    # view; thousands of individual markers make the map unusably slow
+    marker_cluster = MarkerCluster().add_to(image_map)
+
     # amount to offset in x or y if there are images at the same location
     OFFSET = 0.00005
 
-    # function to find a unique location to display the image
-    # this result in a diagonal stack of images (bottom left being the first one and the actual location)
-    def get_unique_location(lat, lon, existing_locations):
-        while (lat, lon) in existing_locations:
-            lat += OFFSET
-            lon += OFFSET
-        return lat, lon
+    # every display position is assigned in one pass up front: images sharing a
+    # rounded location take successive slots up the offset diagonal
+    # (bottom left being the first one and the actual location)
+    latitudes = df_no_nan["latitude"].to_numpy()
+    longitudes = df_no_nan["longitude"].to_numpy()
+
+    location_counts = defaultdict(int)
+    display_lats = np.empty(len(latitudes))
+    display_lons = np.empty(len(longitudes))
+
+    for i, location_key in enumerate(zip(np.round(latitudes, 6), np.round(longitudes, 6))):
+        slot = location_counts[location_key]
+        location_counts[location_key] += 1
+
+        display_lats[i] = latitudes[i] + slot * OFFSET
+        display_lons[i] = longitudes[i] + slot * OFFSET
 
     if sites_bool:
         sites = df_no_nan['site-id'].unique()
@@ -961,26 +1016,40 @@ def create_map(output, df, sites_bool):
             for i, value in enumerate(sites)
         }
 
-    # iterates through df, adding a marker and a popup for each image
-    for i, image in df_no_nan.iterrows():
+    # the popup image paths come from one whole-column string pass rather than
+    # a Path construction and as_posix call per row
+    # (excluded from the popup table along with the other path columns)
+    popup_folders = df_no_nan["output-image-folder"].astype(str).str.replace(os.sep, "/", regex=False)
+    df_no_nan["_popup_path"] = relative_link_path(popup_folders, df_no_nan["output-image-name"])
+    excluded_columns.add("_popup_path")
 
-        image_path = (Path(image["output-image-folder"]) / image["output-image-name"])
-        image_path = image_path.as_posix()
+    # one conversion to plain dicts up front; the marker loop then does dict
+    # lookups instead of materializing a Series per row the way iterrows does
+    records = df_no_nan.to_dict("records")
 
-        html = f"""
+    def popup_html(image):
+        image_path = image["_popup_path"]
+
+        return f"""
             <h4>{image['output-image-name']}</h4>
             <img src="{image_path}" style="width: 100%; height: auto; max-width: 100%;">
 
             <div style="max-height: 120px; overflow-y: auto; font-size: 10px; margin-top: 5px;">
             <table>
                 {''.join(
-                    f'<tr><td><b>{col}</b></td><td>{image[col]}</td></tr>'
-                    for col in image.index if col not in excluded_columns
+                    f'<tr><td><b>{col}</b></td><td>{value}</td></tr>'
+                    for col, value in image.items() if col not in excluded_columns
                 )}
             </table>
             </div>
         """
 
+    # all of the popup html is built in one plain-python pass before any markers
+    popup_htmls = [popup_html(image) for image in records]
+
+    # iterates through the records, adding a marker and a popup for each image
+    for image, html, display_lat, display_lon in zip(records, popup_htmls, display_lats, display_lons):
+
         popup = folium.Popup(html, max_width='auto')
 
         if sites_bool:
@@ -989,25 +1058,12 @@ def create_map(output, df, sites_bool):
         else:
             marker_color = 'red'
 
-        lat = image['latitude']
-        lon = image['longitude']
-        lat_ref = image['latitude-reference']
-        lon_ref = image['longitude-reference']
-
-        if (lat_ref == "S"):
-            lat *= -1
-        if (lon_ref == "W"):
-            lon *= -1
-
-        unique_lat, unique_lon = get_unique_location(lat, lon, existing_locations)
-        existing_locations.add((unique_lat, unique_lon))
-
         folium.Marker(
-            location=[unique_lat, unique_lon],
+            location=[display_lat, display_lon],
             popup=popup,
             tooltip=image['output-image-name'],
             icon=folium.Icon(color=marker_color, icon='camera', prefix='fa')
-        ).add_to(image_map)
+        ).add_to(marker_cluster)
 
     print("✅\n")
 
@@ -1046,16 +1102,26 @@ def process_images(input, output, sites_bool, delete_threshold, max_size_gb):
     site_spreadsheet = output_path / "_IMAGE_METADATA" / "site_data.xlsx"
     excel_spreadsheet.parent.mkdir(parents=True, exist_ok=True)
 
-    df.to_excel(excel_spreadsheet, index=False)
     df.to_csv(csv_spreadsheet, index=False)
     if sites_bool:
         sites_df.to_excel(site_spreadsheet, index=False)
 
-    output_size_in_bytes = sum(f.stat().st_size for f in output_path.rglob("*") if f.is_file())
+    # xlsx is by far the slowest writer, so very large metadata tables only get
+    # the csv, which holds the same data (minus the hyperlink formulas)
+    EXCEL_ROW_LIMIT = 5000
+
+    if len(df) <= EXCEL_ROW_LIMIT:
+        df.to_excel(excel_spreadsheet, index=False)
+        main_spreadsheet = excel_spreadsheet
+    else:
+        print(f"The metadata table has {len(df)} rows, so only the CSV version is written.")
+        main_spreadsheet = csv_spreadsheet
+
+    output_size_in_bytes = sum(entry.stat().st_size for entry in scan_files(output_path))
     output_size_in_gb = output_size_in_bytes / (1024**3)
 
     print(f"✅ Created directory {output} of size: {output_size_in_gb:.2f} GB")
-    print(f"✅ Created spreadsheet: {excel_spreadsheet} \n")
+    print(f"✅ Created spreadsheet: {main_spreadsheet} \n")
 
 
 def main():
@@ -2,4 +2,8 @@ GREEN = "\033[32m"
 RESET = "\033[0m"
 
 INPUT_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'heic'}
-OUTPUT_IMAGE_EXTENSIONS = {'jpg', 'jpeg'}
\ No newline at end of file
+OUTPUT_IMAGE_EXTENSIONS = {'jpg', 'jpeg'}
+
+# dotted, lowercased suffix sets for cheap path.suffix membership checks
+INPUT_IMAGE_SUFFIXES = frozenset('.' + extension for extension in INPUT_IMAGE_EXTENSIONS)
+OUTPUT_IMAGE_SUFFIXES = frozenset('.' + extension for extension in OUTPUT_IMAGE_EXTENSIONS)
\ No newline at end of file
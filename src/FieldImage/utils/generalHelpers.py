@@ -3,11 +3,15 @@
 
 import os
 import re
+import sys
 
 from datetime import datetime, timedelta
 
 from .constants import GREEN, RESET
 
+# compiled once so per-folder validation skips the pattern-cache lookup
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
 
 def validate_date(date_str):
     """Ensure the date is in YYYY-MM-DD format."""
@@ -69,7 +73,48 @@ def get_list_input(prompt):
         else:
             print("Invalid input. Please enter at least one item. Enter 'exit' to quit. \n")
 
-def print_directory_structure(directory, indent=""):
+def batch_prompt(labels):
+    """Prints a numbered block of prompts up front, then reads one answer line per label.
+       This avoids a separate input() round-trip per label; 'exit' still quits."""
+
+    for index, label in enumerate(labels, start=1):
+        print(f"{index}. {label}:")
+
+    answers = []
+
+    for label in labels:
+        line = sys.stdin.readline()
+
+        if not line:  # stdin closed early, the rest stay empty
+            break
+
+        answer = line.strip()
+
+        if answer == "exit":
+            exit()
+
+        answers.append(answer)
+
+    answers.extend("" for _ in range(len(labels) - len(answers)))
+
+    return answers
+
+def print_directory_structure(directory, indent="", tree=None):
+    # if the caller already knows the structure, print it without re-walking the filesystem
+    # tree is a nested mapping of names to children (a dict, a list of leaf names, or None)
+    if tree is not None:
+        if isinstance(tree, dict):
+            entries = tree.items()
+        else:
+            entries = ((name, None) for name in tree)
+
+        for name, children in entries:
+            print(f"{indent}├── {name}")
+            if children:
+                print_directory_structure(directory, indent + "│   ", children)
+
+        return
+
     # List all items in the current directory (this is from ChatGPT)
     with os.scandir(directory) as entries:
         for entry in entries:
@@ -84,4 +129,4 @@ def print_directory_structure(directory, indent=""):
 
 def is_valid_date_format(date_folder):
     """Check if the folder name follows the YYYY-MM-DD format. ChatGPT"""
-    return bool(re.match(r"^\d{4}-\d{2}-\d{2}$", date_folder))
\ No newline at end of file
+    return _DATE_RE.match(date_folder) is not None
\ No newline at end of file
@@ -1,6 +1,8 @@
 # Copyright (c) 2025 Eli Knodel
 # Licensed under the BSD 3-Clause License. See LICENSE file for details.
 
+import io
+import os
 import torch
 
 from wand.image import Image as WandImage
@@ -24,6 +26,15 @@ def convert_and_preserve_image_metadata(input, output):
     except ValueError as e:
         print(f"Invalid filename: {e}")
 
+def is_jpeg(path):
+    """Checks the JPEG SOI marker in the first three bytes of the file."""
+
+    try:
+        with open(path, "rb") as file:
+            return file.read(3) == b"\xff\xd8\xff"
+    except OSError:
+        return False
+
 def coord_to_decimal(tag):
     degrees, minutes, seconds = tag.values
     seconds = seconds.numerator / seconds.denominator
@@ -35,18 +46,72 @@ def frac_to_decimal(tag):
     decimal = frac.numerator / frac.denominator
     return decimal
 
-def get_feature_vector(image_path, model, transform):
-    """ChatGPT"""
-    try:
-        image = PILImage.open(image_path).convert("RGB")
-        image = transform(image).unsqueeze(0)
-        with torch.no_grad():
-            features = model(image)
-        return features.view(-1).numpy()
-    except Exception as e:
-        print(f"Error processing {image_path}: {e}")
-        return None
-    
+class ImagePathDataset(torch.utils.data.Dataset):
+    """Dataset over a list of image paths for batched feature extraction."""
+
+    def __init__(self, image_paths, transform):
+        self.image_paths = image_paths
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, index):
+        image_path = self.image_paths[index]
+
+        try:
+            image = PILImage.open(image_path).convert("RGB")
+            return self.transform(image), True
+        except Exception as e:
+            print(f"Error processing {image_path}: {e}")
+            # a placeholder keeps the batch rectangular; the flag marks it invalid
+            return torch.zeros(3, 224, 224), False
+
+def get_feature_vectors(image_paths, model, transform, batch_size=32):
+    """Runs the model over all images in batches and returns a path -> feature vector dict.
+       Images that could not be read map to None."""
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = model.to(device)
+
+    # half precision on GPU halves memory traffic for the forward pass
+    # (dynamic int8 quantization would only cover linear layers, and the
+    # truncated resnet used here has none, so the CPU path stays float32)
+    use_half = device.type == "cuda"
+
+    if use_half:
+        model = model.half()
+
+    dataset = ImagePathDataset(image_paths, transform)
+    loader = torch.utils.data.DataLoader(
+        dataset,
+        batch_size=batch_size,
+        num_workers=os.cpu_count() or 1,
+        pin_memory=(device.type == "cuda")
+    )
+
+    num_images = len(image_paths)
+    feature_vectors = {}
+    processed = 0
+
+    with torch.inference_mode():
+        for batch, valid_flags in loader:
+            batch = batch.to(device, non_blocking=True)
+
+            if use_half:
+                batch = batch.half()
+
+            features = model(batch)
+            features = features.view(features.size(0), -1).cpu().numpy()
+
+            for vector, valid in zip(features, valid_flags):
+                feature_vectors[image_paths[processed]] = vector if valid else None
+                processed += 1
+                print(f"Getting feature vector for image {processed}/{num_images}", end="\r", flush=True)
+
+    return feature_vectors
+
+
 def calc_max_pic_size(num_images, available_data):
     if num_images == 0:
         print("Total image data was already below the inputted threshold!")
@@ -54,25 +119,48 @@ def calc_max_pic_size(num_images, available_data):
     else:
         return available_data / num_images
 
-def reduce_image(image_path, target_size_mb, step=5):
+def reduce_image(image_path, target_size_mb, img=None):
+    """Re-encodes the image at image_path in place to fit under target_size_mb.
+       Callers that already hold the decoded PIL image can pass it as img to skip a second JPEG decode."""
+
     image_path = Path(image_path)
     target_size_bytes = target_size_mb * (1024 ** 2)
-    quality = 100 - step
 
-    # saving a temporary image in the same location as the original image with "_temp" added on
-    temp_path = image_path.parent / f"{image_path.stem}_temp{image_path.suffix}"
+    opened = None
+
+    if img is None:
+        opened = img = PILImage.open(image_path)
 
-    with PILImage.open(image_path) as img:
+    try:
         # this ensures that image orientation is preserved
         img = ImageOps.exif_transpose(img)
 
-        while quality > 0:
-            img.save(temp_path, quality=quality)
-            size_bytes = temp_path.stat().st_size
-            if size_bytes <= target_size_bytes:
-                break
-            quality -= step
+        # binary search for the highest quality that fits the target,
+        # instead of stepping down from the top one encode at a time
+        # the probes encode into memory; only the winning bytes touch the disk
+        low, high = 10, 95
+        best_buffer = None
+
+        while low <= high:
+            quality = (low + high) // 2
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=quality)
+
+            if buffer.tell() <= target_size_bytes:
+                best_buffer = buffer
+                low = quality + 1
+            else:
+                high = quality - 1
+
+        # when nothing fit, the last probe was the floor quality,
+        # which is as small as the image gets
+        if best_buffer is None:
+            best_buffer = buffer
+    finally:
+        if opened is not None:
+            opened.close()
 
-    temp_path.replace(image_path)
+    size_bytes = best_buffer.tell()
+    image_path.write_bytes(best_buffer.getvalue())
 
     return size_bytes / (1024 ** 2)
\ No newline at end of file